@@ -7,57 +7,539 @@ Tutte le operazioni vengono loggate tramite il logger passato come parametro.
 """
 
 import os
+import sys
+import errno
 import shutil
 import time
 import re
 import logging
+import threading
+import uuid
+import itertools
+from pathlib import PurePath
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar, cast
+from concurrent.futures import Future, ThreadPoolExecutor
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.observers.api import BaseObserver, ObservedWatch
+from watchdog.events import (
+    FileSystemEvent, FileSystemEventHandler, FileSystemMovedEvent, PatternMatchingEventHandler,
+)
 
+# Separa nome base, numero finale ed estensione (es. "fattura12.xml" -> "fattura", "12", ".xml")
+_NUM_RE = re.compile(r"^(.*?)(\d+)?(\.[^.]+)$")
 
-class CopyHandler(FileSystemEventHandler):
+# Firma usata per capire se un file in attesa è ancora in scrittura: (dimensione, mtime in ns)
+_Signature = Tuple[Optional[int], int]
+# Valori sempre diversi usati come firma quando os.stat fallisce: due controlli non coincidono mai
+_stat_failures = itertools.count()
+_T = TypeVar('_T')
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    _CopyFileExW = ctypes.WinDLL('kernel32', use_last_error=True).CopyFileExW
+    _CopyFileExW.argtypes = [
+        wintypes.LPCWSTR, wintypes.LPCWSTR, ctypes.c_void_p,
+        ctypes.c_void_p, ctypes.POINTER(wintypes.BOOL), wintypes.DWORD,
+    ]
+    _CopyFileExW.restype = wintypes.BOOL
+
+if sys.platform == 'linux':
+    # Byte richiesti a ogni chiamata di os.copy_file_range (il kernel può copiarne meno)
+    _COPY_CHUNK = 64 * 1024 * 1024
+    # Errori con cui copy_file_range segnala che il filesystem o il kernel non lo supportano
+    _COPY_FILE_RANGE_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+    def _copy_file_range(src: str, dest: str) -> bool:
+        """
+        Copia src in dest con os.copy_file_range: la copia avviene interamente nel kernel,
+        senza tenere il GIL, e su NFS/SMB può diventare una copia lato server.
+
+        Args:
+            src (str): Percorso del file di origine.
+            dest (str): Percorso di destinazione.
+
+        Returns:
+            bool: False se copy_file_range non ha copiato nulla (non supportato o file vuoto), True altrimenti.
+        """
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            infd, outfd = fsrc.fileno(), fdst.fileno()
+            copied_any = False
+            while True:
+                try:
+                    copied = os.copy_file_range(infd, outfd, _COPY_CHUNK)
+                except OSError as e:
+                    if not copied_any and e.errno in _COPY_FILE_RANGE_UNSUPPORTED:
+                        return False
+                    raise
+                if copied == 0:
+                    # Uno 0 alla prima chiamata può indicare che il filesystem non supporta
+                    # copy_file_range: si ripiega su shutil.copyfile (che gestisce anche i file vuoti)
+                    return copied_any
+                copied_any = True
+
+
+def _fast_copy(src: str, dest: str) -> None:
+    """
+    Copia src in dest delegando il lavoro al sistema operativo, con gli stessi metadati di shutil.copy2.
+    Su Windows usa CopyFileExW (copia lato kernel, ottimizzata anche per share SMB);
+    su Linux os.copy_file_range, con shutil.copyfile (os.sendfile) come ripiego, che altrove
+    è l'unico metodo; poi shutil.copystat.
+    In entrambi i casi il GIL viene rilasciato per tutta la copia (ctypes.WinDLL lo rilascia
+    durante la chiamata), quindi le copie del pool procedono davvero in parallelo.
+
+    Args:
+        src (str): Percorso del file di origine.
+        dest (str): Percorso di destinazione.
+    """
+    if sys.platform == 'win32':
+        if not _CopyFileExW(src, dest, None, None, None, 0):
+            # WinError mappa ERROR_ACCESS_DENIED/ERROR_SHARING_VIOLATION su PermissionError
+            raise ctypes.WinError(ctypes.get_last_error())
+    else:
+        copied = False
+        if sys.platform == 'linux':
+            copied = _copy_file_range(src, dest)
+        if not copied:
+            shutil.copyfile(src, dest)
+        shutil.copystat(src, dest)
+
+
+def _copy_into_place(src: str, dest: str) -> None:
+    """
+    Copia src in dest senza mai esporre in dest un file parziale con il nome definitivo:
+    copia su un nome temporaneo ('.<uuid>.part') nella cartella di dest e poi lo rinomina
+    con os.replace, che sullo stesso volume è atomico (su Windows MoveFileExW con
+    MOVEFILE_REPLACE_EXISTING, senza copia). I '.part' non sono .xml, quindi non vengono contati.
+
+    Args:
+        src (str): Percorso del file di origine.
+        dest (str): Percorso finale.
+    """
+    part = os.path.join(os.path.dirname(dest), f".{uuid.uuid4().hex}.part")
+    try:
+        _fast_copy(src, part)
+        os.replace(part, dest)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def _stat_signature(path: str) -> Optional[_Signature]:
+    """
+    Firma usata per capire se un file è ancora in scrittura.
+
+    Args:
+        path (str): Percorso del file.
+
+    Returns:
+        tuple: (dimensione, mtime in ns), oppure None se il file non esiste più.
+            Se os.stat fallisce la firma è sempre nuova, quindi il file non risulta mai stabile.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        # Es. file ancora bloccato: si riprova al giro successivo
+        return (None, next(_stat_failures))
+    return (st.st_size, st.st_mtime_ns)
+
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor con un limite alle attività in coda o in esecuzione.
+    Oltre il limite submit() blocca il chiamante finché una copia non termina,
+    così una raffica di file non fa crescere la memoria senza controllo.
+    """
+    def __init__(self, max_workers: int, max_queue: Optional[int] = None,
+                 logger: Optional[logging.Logger] = None, **kwargs: Any) -> None:
+        """
+        Args:
+            max_workers (int): Numero massimo di thread.
+            max_queue (int): Attività in attesa oltre a quelle in esecuzione (default max_workers * 2).
+            logger (logging.Logger): Logger su cui segnalare quando la coda è piena.
+            **kwargs: Parametri passati a ThreadPoolExecutor.
+        """
+        super().__init__(max_workers=max_workers, **kwargs)
+        if max_queue is None:
+            max_queue = max_workers * 2
+        self.max_queue = max_queue
+        self.logger = logger
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, fn: Callable[..., _T], /, *args: Any, **kwargs: Any) -> 'Future[_T]':
+        """
+        Come ThreadPoolExecutor.submit, ma attende un posto libero se la coda è piena.
+        """
+        if not self._slots.acquire(blocking=False):
+            if self.logger is not None:
+                self.logger.warning(
+                    "Coda di copia piena (%d in attesa): attendo il completamento delle copie in corso",
+                    self.max_queue,
+                )
+            self._slots.acquire()
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+class CopyHandler(PatternMatchingEventHandler):
     """
     Handler personalizzato per gli eventi watchdog.
     Si occupa di copiare i file .xml appena creati nella root della source_dir nella dest_dir.
+    Il filtro su estensione, file temporanei ('~$...', '.tmp') e cartelle è delegato a watchdog,
+    che scarta gli eventi non pertinenti prima di chiamare i metodi on_*.
     """
-    def __init__(self, source_dir, dest_dir, logger):
+    def __init__(self, source_dir: str, dest_dir: str, logger: logging.Logger, max_workers: int = 4,
+                 max_queue: Optional[int] = None, max_pending: int = 1000, resync_interval: float = 600,
+                 settle_time: float = 0.5, poll_interval: float = 0.25) -> None:
         """
         Args:
             source_dir (str): Directory da monitorare.
             dest_dir (str): Directory di destinazione dei file copiati.
             logger (logging.Logger): Logger per tracciare tutte le operazioni.
+            max_workers (int): Numero massimo di copie eseguite in parallelo.
+            max_queue (int): Numero massimo di copie in attesa (default max_workers * 2).
+            max_pending (int): Numero massimo di file rilevati in attesa che smettano di cambiare;
+                oltre il limite i nuovi file vengono scartati e recuperati rileggendo la source_dir
+                appena l'attesa si svuota.
+            resync_interval (int): Secondi dopo i quali l'elenco file in memoria
+                viene riallineato rileggendo le directory.
+            settle_time (float): Secondi per cui dimensione e data di modifica di un file
+                devono restare invariate prima di copiarlo.
+            poll_interval (float): Intervallo in secondi tra due controlli dei file in attesa.
         """
+        super().__init__(
+            patterns=["*.xml"],
+            ignore_patterns=["~$*", "*.tmp"],
+            ignore_directories=True,
+            case_sensitive=False,
+        )
         self.source_dir = source_dir
+        # Forma normalizzata della source_dir, calcolata una volta per il filtro sugli eventi
+        self._source_norm = os.path.normcase(os.path.normpath(source_dir))
         self.dest_dir = dest_dir
         self.logger = logger
+        # Le copie vengono eseguite in un pool di thread per non bloccare il thread di watchdog;
+        # la coda è limitata, quindi in caso di arretrato l'invio di nuove copie rallenta
+        self.executor = BoundedExecutor(
+            max_workers, max_queue=max_queue, logger=logger, thread_name_prefix="BackupCopy"
+        )
+        # Protegge la scelta del nome di destinazione tra copie concorrenti.
+        # _dst_names contiene i nomi (normcase) già presenti in dest_dir,
+        # _reserved_dests quelli scelti da copie ancora in corso.
+        self._dest_lock = threading.Lock()
+        self._dst_names: Set[str] = set()
+        self._reserved_dests: Set[str] = set()
+        # File rilevati ma forse ancora in scrittura: percorso -> (firma stat, istante della firma).
+        # Un thread dedicato li passa al pool di copia quando la firma resta stabile per settle_time.
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        # _pending è limitato: oltre max_pending i nuovi file vengono scartati (on_created non deve
+        # bloccare il thread di watchdog, condiviso tra i worker) e recuperati da resync_file_sets,
+        # che il thread di attesa chiama appena _pending si svuota.
+        self._pending: Dict[str, Tuple[Optional[_Signature], float]] = {}
+        self._pending_limit = max_pending
+        self._pending_overflow = False
+        self._pending_cond = threading.Condition()
+        # File passati al pool e non ancora conclusi, e file copiati dall'ultimo riallineamento:
+        # resync_file_sets non li rimette in attesa anche se non li trova ancora in dest_dir
+        self._in_flight: Set[str] = set()
+        self._copied_since_resync: Set[str] = set()
+        self._stopping = False
+        # Elenco dei file XML in memoria, aggiornato dagli eventi watchdog
+        self.resync_interval = resync_interval
+        self._files_lock = threading.Lock()
+        self.src_files: Set[str] = set()
+        self.dst_files: Set[str] = set()
+        self._last_resync = 0.0
+        # Il riallineamento può partire sia dal thread del worker sia dal thread di attesa
+        self._resync_lock = threading.Lock()
+        self.resync_file_sets()
+        self._settle_thread = threading.Thread(
+            target=self._watch_pending, name="BackupSettle", daemon=True
+        )
+        self._settle_thread.start()
+
+    def resync_file_sets(self) -> None:
+        """
+        Rilegge source_dir e dest_dir e riallinea gli elenchi dei file in memoria.
+        Serve a recuperare eventuali eventi persi o modifiche fatte da altri processi:
+        i file .xml della source_dir assenti in dest_dir vengono messi in attesa di copia.
+        """
+        with self._resync_lock:
+            self._resync_file_sets()
+
+    def _resync_file_sets(self) -> None:
+        """
+        Corpo di resync_file_sets, da chiamare con _resync_lock acquisito.
+        """
+        with self._pending_cond:
+            # Una copia conclusa da qui in poi potrebbe non comparire nella lettura di dest_dir
+            self._copied_since_resync.clear()
+        src_files = set(list_files_windows_style(self.source_dir))
+        # Una sola lettura di dest_dir per l'elenco XML e per i nomi usati nella gestione duplicati
+        with os.scandir(self.dest_dir) as entries:
+            dst_entries = [(e.name, e.is_file()) for e in entries]
+        dst_files = {name for name, is_file in dst_entries if is_file and _is_listed_file(name)}
+        dst_names = {os.path.normcase(name) for name, _ in dst_entries}
+        with self._files_lock:
+            self.src_files = src_files
+            self.dst_files = dst_files
+            self._last_resync = time.monotonic()
+        with self._dest_lock:
+            self._dst_names = dst_names
+        missing = [os.path.join(self.source_dir, name) for name in src_files - dst_files]
+        if missing:
+            self._add_pending(missing, skip_known=True)
 
-    def on_created(self, event):
+    def snapshot_files(self) -> Tuple[List[str], List[str]]:
+        """
+        Restituisce gli elenchi ordinati dei file XML in source e dest senza accedere al disco,
+        salvo il riallineamento periodico ogni resync_interval secondi.
+
+        Returns:
+            tuple: (lista file source, lista file dest) ordinate in stile Windows.
+        """
+        if time.monotonic() - self._last_resync > self.resync_interval:
+            self.resync_file_sets()
+        with self._files_lock:
+            src_files = list(self.src_files)
+            dst_files = list(self.dst_files)
+        return (
+            sorted(src_files, key=extract_base_and_num),
+            sorted(dst_files, key=extract_base_and_num),
+        )
+
+    def _root_name(self, path: str) -> Optional[str]:
+        """
+        Restituisce il nome del file se path si trova nella root della source_dir, altrimenti None.
+        """
+        if os.path.normcase(os.path.dirname(path)) != self._source_norm:
+            # Ignora file in sottocartelle
+            return None
+        return os.path.basename(path)
+
+    def on_created(self, event: FileSystemEvent) -> None:
         """
         Callback chiamata da watchdog quando viene creato un file nella directory monitorata.
         Copia solo i file .xml presenti nella root (non nelle sottocartelle).
         """
-        
-        if event.is_directory:
+        # La directory è registrata come str, quindi anche i percorsi degli eventi lo sono
+        src_path = cast(str, event.src_path)
+        filename = self._root_name(src_path)
+        if filename is None:
             return
 
-        rel_path = os.path.relpath(event.src_path, self.source_dir)
-        if os.path.dirname(rel_path):
-            # Ignora file in sottocartelle
-            return
+        with self._files_lock:
+            self.src_files.add(filename)
 
-        if not event.src_path.lower().endswith('.xml'):
-            return
+        # La copia parte solo quando il file smette di cambiare (vedi _watch_pending)
+        self._add_pending([src_path])
 
-        dest_path = os.path.join(self.dest_dir, os.path.basename(event.src_path))
+    def _add_pending(self, paths: List[str], skip_known: bool = False) -> None:
+        """
+        Mette i file in attesa che smettano di cambiare prima di copiarli.
+        Se l'attesa è piena (max_pending) i file in più vengono scartati: essendo assenti
+        in dest_dir, li rimette in attesa resync_file_sets, chiamato appena l'attesa si svuota.
+
+        Args:
+            paths (list[str]): Percorsi dei file da copiare.
+            skip_known (bool): Se True ignora i file già in attesa, in copia o copiati dall'ultimo riallineamento.
+        """
+        dropped = 0
+        with self._pending_cond:
+            was_empty = not self._pending
+            now = time.monotonic()
+            for path in paths:
+                if skip_known and (
+                    path in self._pending or path in self._in_flight or path in self._copied_since_resync
+                ):
+                    continue
+                if path not in self._pending and len(self._pending) >= self._pending_limit:
+                    dropped += 1
+                    continue
+                self._pending[path] = (None, now)
+            # Sveglia il thread di attesa solo se era fermo: notificare a ogni evento
+            # interromperebbe l'attesa di poll_interval e moltiplicherebbe gli os.stat
+            if was_empty and self._pending:
+                self._pending_cond.notify()
+            # Un solo avviso per ogni episodio di coda piena, non uno per file
+            warn = dropped > 0 and not self._pending_overflow
+            if dropped:
+                self._pending_overflow = True
+        if warn:
+            self.logger.warning(
+                "Troppi file in attesa di copia (%d): i file in eccesso verranno copiati "
+                "appena la coda si svuota",
+                self._pending_limit,
+            )
+
+    def on_modified(self, event: FileSystemEvent) -> None:
+        """
+        Callback chiamata da watchdog quando un file viene modificato.
+        Se il file è in attesa di copia, riparte l'attesa di stabilità.
+        """
+        src_path = cast(str, event.src_path)
+        with self._pending_cond:
+            if src_path in self._pending:
+                self._pending[src_path] = (None, time.monotonic())
+
+    def _watch_pending(self) -> None:
+        """
+        Ciclo del thread di attesa: controlla i file in _pending ogni poll_interval secondi
+        e invia alla copia quelli con dimensione e data di modifica stabili da almeno settle_time.
+        I file eliminati nel frattempo vengono scartati. Se dei file sono stati scartati per
+        _pending pieno, quando l'attesa si svuota rilegge le directory per recuperarli.
+        """
+        while True:
+            with self._pending_cond:
+                while not self._pending and not self._stopping:
+                    self._pending_cond.wait()
+                if self._stopping:
+                    return
+                pending = list(self._pending.items())
+
+            # os.stat fuori dal lock, per non bloccare il thread di watchdog
+            now = time.monotonic()
+            signatures = {path: _stat_signature(path) for path, _ in pending}
+
+            ready = []
+            with self._pending_cond:
+                for path, entry in pending:
+                    if self._pending.get(path) != entry:
+                        # Aggiornato da on_modified durante il controllo
+                        continue
+                    signature = signatures[path]
+                    if signature is None:
+                        del self._pending[path]
+                    elif signature != entry[0]:
+                        self._pending[path] = (signature, now)
+                    elif now - entry[1] >= self.settle_time:
+                        del self._pending[path]
+                        # Segnato come in copia nello stesso lock, così resync_file_sets non lo perde di vista
+                        self._in_flight.add(path)
+                        ready.append(path)
+                recover = self._pending_overflow and not self._pending
+                if recover:
+                    self._pending_overflow = False
+                elif not self._stopping:
+                    self._pending_cond.wait(self.poll_interval)
+
+            for path in ready:
+                self._submit_copy(path)
+            if recover:
+                try:
+                    self.resync_file_sets()
+                except OSError as e:
+                    self.logger.error("Errore nella rilettura delle directory: %s", e)
+
+    def _submit_copy(self, src_path: str) -> None:
+        """
+        Invia al pool di thread la copia di src_path in dest_dir.
+
+        Args:
+            src_path (str): Percorso del file da copiare.
+        """
+        filename = os.path.basename(src_path)
+        dest_path = os.path.join(self.dest_dir, filename)
         try:
-            self.copy_file_safely(event.src_path, dest_path)
+            future = self.executor.submit(self.copy_file_safely, src_path, dest_path)
         except Exception as e:
-            self.logger.error(f"Errore nella copia di {rel_path}: {e}")
+            self.logger.error("Errore nella copia di %s: %s", filename, e)
+            self._copy_done(src_path)
+            return
+        future.add_done_callback(lambda _: self._copy_done(src_path))
+
+    def _copy_done(self, src_path: str) -> None:
+        """
+        Segna come conclusa la copia di src_path (riuscita o meno).
 
-    def copy_file_safely(self, src, dest, retries=3, delay=0.5):
+        Args:
+            src_path (str): Percorso del file copiato.
+        """
+        with self._pending_cond:
+            self._in_flight.discard(src_path)
+            self._copied_since_resync.add(src_path)
+
+    def shutdown(self) -> None:
+        """
+        Ferma il thread di attesa e attende il completamento di tutte le copie in corso.
+        I file ancora in attesa vengono controllati un'ultima volta: si copiano solo quelli
+        invariati per settle_time, gli altri (ancora in scrittura) vengono scartati
+        e recuperati dal riallineamento al successivo avvio.
+        """
+        with self._pending_cond:
+            self._stopping = True
+            self._pending_cond.notify_all()
+        self._settle_thread.join()
+        with self._pending_cond:
+            pending = list(self._pending)
+            self._pending.clear()
+        if pending:
+            before = {path: _stat_signature(path) for path in pending}
+            time.sleep(self.settle_time)
+            ready = []
+            for path, signature in before.items():
+                if signature is None:
+                    continue
+                if _stat_signature(path) == signature:
+                    ready.append(path)
+                else:
+                    self.logger.warning(
+                        "File ancora in scrittura alla chiusura, non copiato: %s", os.path.basename(path)
+                    )
+            with self._pending_cond:
+                self._in_flight.update(ready)
+            for path in ready:
+                self._submit_copy(path)
+        self.executor.shutdown(wait=True)
+
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        """
+        Callback chiamata da watchdog quando viene eliminato un file nella directory monitorata.
+        Aggiorna l'elenco dei file in memoria.
+        """
+        filename = self._root_name(cast(str, event.src_path))
+        if filename is None:
+            return
+
+        with self._files_lock:
+            self.src_files.discard(filename)
+
+    def on_moved(self, event: FileSystemMovedEvent) -> None:
+        """
+        Callback chiamata da watchdog quando un file viene rinominato o spostato.
+        Aggiorna l'elenco dei file in memoria e, se il nuovo nome è un .xml nella root
+        (es. programmi che scrivono un '.tmp' e poi lo rinominano), mette il file in attesa di copia.
+        """
+        # watchdog inoltra lo spostamento se almeno uno dei due percorsi è un .xml:
+        # la regola va quindi verificata su entrambi
+        src_path = cast(str, event.src_path)
+        dest_path = cast(str, event.dest_path)
+        old_name = self._root_name(src_path)
+        if old_name is not None and not _is_listed_file(old_name):
+            old_name = None
+        new_name = self._root_name(dest_path)
+        if new_name is not None and not _is_listed_file(new_name):
+            new_name = None
+        with self._files_lock:
+            if old_name is not None:
+                self.src_files.discard(old_name)
+            if new_name is not None:
+                self.src_files.add(new_name)
+        if new_name is not None:
+            self._add_pending([dest_path])
+
+    def copy_file_safely(self, src: str, dest: str, retries: int = 3, delay: float = 0.5) -> None:
         """
         Copia il file src in dest, aggiungendo un suffisso numerico se necessario.
-        Ignora file temporanei (che iniziano con '~$' o terminano con '.tmp').
         Riprova la copia in caso di PermissionError.
 
         Args:
@@ -66,38 +548,96 @@ class CopyHandler(FileSystemEventHandler):
             retries (int): Numero massimo di tentativi in caso di errore.
             delay (float): Attesa in secondi tra i tentativi.
         """
-        base, ext = os.path.splitext(dest)
-        new_dest = dest
-        filename = os.path.basename(src)
-        if filename.startswith('~$') or filename.endswith('.tmp'):
-            self.logger.info(f"File temporaneo ignorato: {filename}")
-            return
+        # Scomposizione del percorso fatta una volta: nel ciclo si lavora solo sui nomi
+        src_name = PurePath(src).name
+        dest_p = PurePath(dest)
+        dest_parent = str(dest_p.parent)
+        prefix, ext = f"{dest_p.stem} ", dest_p.suffix
+        new_name = dest_p.name
+        # Il nome scelto resta riservato finché la copia non è conclusa,
+        # così due copie parallele non possono puntare allo stesso file.
+        # I duplicati si risolvono sui nomi in memoria; solo il candidato scelto
+        # viene verificato su disco, per non sovrascrivere file creati da altri processi.
+        # La verifica avviene fuori dal lock: su una share di rete è un round-trip
+        # e bloccherebbe le altre copie e resync_file_sets.
         count = 1
-        while os.path.exists(new_dest):
-            new_dest = f"{base} {count}{ext}"
-            count += 1
-
-        for attempt in range(retries):
-            try:
-                shutil.copy2(src, new_dest)
-                self.logger.info(
-                    f"File copiato: {os.path.relpath(src, self.source_dir)} -> {os.path.relpath(new_dest, self.dest_dir)}"
-                )
-                return
-            except PermissionError as e:
-                if attempt < retries - 1:
-                    self.logger.warning(f"Permesso negato per {src}, ritento ({attempt+1})...")
-                    time.sleep(delay)
-                else:
-                    self.logger.error(f"Permesso negato per {src} dopo {retries} tentativi: {e}")
-            except Exception as e:
-                self.logger.error(f"Errore nella copia di {src}: {e}")
-                return
+        while True:
+            with self._dest_lock:
+                dest_key = os.path.normcase(new_name)
+                while dest_key in self._dst_names or dest_key in self._reserved_dests:
+                    new_name = f"{prefix}{count}{ext}"
+                    count += 1
+                    dest_key = os.path.normcase(new_name)
+                self._reserved_dests.add(dest_key)
+            new_dest = os.path.join(dest_parent, new_name)
+            if not os.path.exists(new_dest):
+                break
+            # Creato da un altro processo: il nome si segna come occupato e si prova il successivo
+            with self._dest_lock:
+                self._dst_names.add(dest_key)
+                self._reserved_dests.discard(dest_key)
+
+        try:
+            for attempt in range(retries):
+                try:
+                    _copy_into_place(src, new_dest)
+                    with self._dest_lock:
+                        self._dst_names.add(dest_key)
+                    with self._files_lock:
+                        self.dst_files.add(new_name)
+                    # I file sono sempre nella root delle due cartelle: il percorso relativo è il nome del file
+                    self.logger.info("File copiato: %s -> %s", src_name, new_name)
+                    return
+                except PermissionError as e:
+                    if attempt < retries - 1:
+                        self.logger.warning("Permesso negato per %s, ritento (%d)...", src, attempt + 1)
+                        time.sleep(delay)
+                    else:
+                        self.logger.error("Permesso negato per %s dopo %d tentativi: %s", src, retries, e)
+                except Exception as e:
+                    self.logger.error("Errore nella copia di %s: %s", src, e)
+                    return
+        finally:
+            with self._dest_lock:
+                self._reserved_dests.discard(dest_key)
 
-def list_files_windows_style(directory, extension=".xml"):
+def extract_base_and_num(filename: str) -> Tuple[str, int, str]:
+    """
+    Chiave di ordinamento in stile Windows: (base, numero finale, estensione).
+
+    Args:
+        filename (str): Nome del file.
+
+    Returns:
+        tuple: (base, numero, estensione).
+    """
+    m = _NUM_RE.match(filename)
+    if m:
+        base, num, ext = m.groups()
+        num = int(num) if num else 0
+        return (base, num, ext)
+    else:
+        return (filename, 0, "")
+
+def _is_listed_file(name: str, extension: str = ".xml") -> bool:
+    """
+    Indica se un file va contato: stessa regola dei pattern di CopyHandler,
+    cioè estensione richiesta ed esclusione dei file temporanei ('~$...', '.tmp').
+
+    Args:
+        name (str): Nome del file.
+        extension (str): Estensione in minuscolo (default .xml).
+
+    Returns:
+        bool: True se il file va considerato.
+    """
+    lower = name.lower()
+    return lower.endswith(extension) and not name.startswith('~$') and not lower.endswith('.tmp')
+
+def list_files_windows_style(directory: str, extension: str = ".xml") -> List[str]:
     """
     Restituisce la lista dei file nella directory principale, ordinata in stile Windows:
-    base.xml, base1.xml, base2.xml, ecc.
+    base.xml, base1.xml, base2.xml, ecc. I file temporanei ('~$...', '.tmp') sono esclusi.
 
     Args:
         directory (str): Cartella dove elencare i file.
@@ -106,54 +646,95 @@ def list_files_windows_style(directory, extension=".xml"):
     Returns:
         list[str]: Lista dei file ordinati.
     """
-    files = [
-        f for f in os.listdir(directory)
-        if os.path.isfile(os.path.join(directory, f)) and f.lower().endswith(extension)
-    ]
-    def extract_base_and_num(filename):
-        m = re.match(r"^(.*?)(\d+)?(\.[^.]+)$", filename)
-        if m:
-            base, num, ext = m.groups()
-            num = int(num) if num else 0
-            return (base, num, ext)
-        else:
-            return (filename, 0, "")
+    extension = extension.lower()
+    # os.scandir riusa i dati della lettura della directory: niente stat separato per ogni file
+    with os.scandir(directory) as entries:
+        files = [
+            e.name for e in entries
+            if e.is_file() and _is_listed_file(e.name, extension)
+        ]
+    return sorted(files, key=extract_base_and_num)
+
+def log_counts(handler: CopyHandler, logger: logging.Logger) -> None:
+    """
+    Logga il conteggio e la lista dei file nelle directory sorgente e destinazione.
+    Usa l'elenco in memoria mantenuto dall'handler invece di rileggere le directory.
+
+    Args:
+        handler (CopyHandler): Handler che mantiene l'elenco dei file.
+        logger (logging.Logger): Logger da utilizzare.
+    """
+    src_files, dst_files = handler.snapshot_files()
+    logger.info("File in source: %d | File in dest: %d", len(src_files), len(dst_files))
+    logger.info("Lista file source: %s", src_files)
+    logger.info("Lista file dest: %s", dst_files)
 
-    files_sorted = sorted(
-        files,
-        key=lambda f: extract_base_and_num(f)
-    )
-    return files_sorted
+# Observer condiviso tra tutti i worker attivi nel processo: ogni source_dir viene
+# registrata con schedule() sullo stesso thread, invece di crearne uno per worker.
+# Un Observer fermato non può ripartire, quindi viene ricreato quando serve.
+_shared_observer: Optional[BaseObserver] = None
+_observer_lock = threading.Lock()
+_watch_handlers: Dict[ObservedWatch, int] = {}
 
-def count_files_in_directory(directory):
+def _schedule_watch(event_handler: FileSystemEventHandler, path: str) -> ObservedWatch:
     """
-    Conta il numero totale di file XML (solo nella root) in una directory.
+    Registra event_handler sull'Observer condiviso, avviandolo se necessario.
 
     Args:
-        directory (str): Cartella da analizzare.
+        event_handler (FileSystemEventHandler): Handler degli eventi.
+        path (str): Directory da monitorare (solo root).
 
     Returns:
-        tuple: (numero file, lista dei file ordinati)
+        ObservedWatch: Watch da passare a _unschedule_watch alla chiusura.
     """
-    files = list_files_windows_style(directory)
-    return len(files), files
+    global _shared_observer
+    with _observer_lock:
+        if _shared_observer is None:
+            _shared_observer = Observer()
+            _shared_observer.start()
+        try:
+            watch = _shared_observer.schedule(event_handler, path, recursive=False)
+        except Exception:
+            # Es. limite di watch del sistema raggiunto: non lasciare attivo un Observer senza watch
+            if not _watch_handlers:
+                _shared_observer.stop()
+                _shared_observer.join()
+                _shared_observer = None
+            raise
+        _watch_handlers[watch] = _watch_handlers.get(watch, 0) + 1
+        return watch
 
-def log_counts(source_dir, dest_dir, logger):
+def _unschedule_watch(event_handler: FileSystemEventHandler, watch: ObservedWatch) -> None:
     """
-    Logga il conteggio e la lista dei file nelle directory sorgente e destinazione.
+    Rimuove event_handler dall'Observer condiviso.
+    L'Observer viene fermato solo quando non restano più watch attivi.
 
     Args:
-        source_dir (str): Directory di origine.
-        dest_dir (str): Directory di destinazione.
-        logger (logging.Logger): Logger da utilizzare.
+        event_handler (FileSystemEventHandler): Handler registrato con _schedule_watch.
+        watch (ObservedWatch): Watch restituito da _schedule_watch.
     """
-    src_count, src_files = count_files_in_directory(source_dir)
-    dst_count, dst_files = count_files_in_directory(dest_dir)
-    logger.info(f"File in source: {src_count} | File in dest: {dst_count}")
-    logger.info(f"Lista file source: {src_files}")
-    logger.info(f"Lista file dest: {dst_files}")
+    global _shared_observer
+    with _observer_lock:
+        observer = _shared_observer
+        if observer is None:
+            # Nessun watch attivo: niente da rimuovere
+            return
+        remaining = _watch_handlers.pop(watch, 1) - 1
+        if remaining > 0:
+            # Altri handler usano ancora la stessa directory
+            _watch_handlers[watch] = remaining
+            observer.remove_handler_for_watch(event_handler, watch)
+        else:
+            observer.unschedule(watch)
+        if _watch_handlers:
+            return
+        _shared_observer = None
+    observer.stop()
+    observer.join()
 
-def start_backup_worker(source_dir, dest_dir, logger, count_interval=60, external_stop_event=None):
+def start_backup_worker(source_dir: str, dest_dir: str, logger: logging.Logger, count_interval: float = 60,
+                        external_stop_event: Optional[threading.Event] = None, max_workers: int = 4,
+                        max_queue: Optional[int] = None, max_pending: int = 1000) -> None:
     """
     Avvia il backup worker che monitora source_dir e copia i nuovi file XML in dest_dir.
 
@@ -163,29 +744,48 @@ def start_backup_worker(source_dir, dest_dir, logger, count_interval=60, externa
         logger (logging.Logger): Logger da utilizzare.
         count_interval (int): Intervallo in secondi tra un log di conteggio e l'altro.
         external_stop_event (threading.Event): Evento di stop per terminare il worker.
+        max_workers (int): Numero massimo di copie eseguite in parallelo.
+        max_queue (int): Numero massimo di copie in attesa (default max_workers * 2).
+        max_pending (int): Numero massimo di file in attesa che smettano di cambiare.
     """
     if not os.path.isdir(source_dir):
-        logger.error(f"La directory sorgente non esiste: {source_dir}")
+        logger.error("La directory sorgente non esiste: %s", source_dir)
         return
     if not os.path.isdir(dest_dir):
-        logger.error(f"La directory di destinazione non esiste: {dest_dir}")
+        logger.error("La directory di destinazione non esiste: %s", dest_dir)
         return
 
-    logger.info(f"Backup worker avviato: {source_dir} -> {dest_dir}")
-    event_handler = CopyHandler(source_dir, dest_dir, logger)
-    observer = Observer()
-    observer.schedule(event_handler, source_dir, recursive=False)
-    observer.start()
+    # Watchdog costruisce i percorsi degli eventi a partire da questo valore:
+    # normalizzandolo restano confrontabili con CopyHandler._source_norm
+    source_dir = os.path.normpath(source_dir)
+    logger.info("Backup worker avviato: %s -> %s", source_dir, dest_dir)
     try:
-        last_check = time.time()
+        # Il costruttore legge già le due directory: un errore qui non deve chiudere il thread senza log
+        event_handler = CopyHandler(
+            source_dir, dest_dir, logger,
+            max_workers=max_workers, max_queue=max_queue, max_pending=max_pending,
+        )
+    except Exception as e:
+        logger.error("Impossibile avviare il backup worker %s -> %s: %s", source_dir, dest_dir, e)
+        return
+    try:
+        watch = _schedule_watch(event_handler, source_dir)
+    except Exception as e:
+        logger.error("Impossibile monitorare la directory sorgente %s: %s", source_dir, e)
+        # Ferma il thread di attesa e il pool di copia
+        event_handler.shutdown()
+        return
+    try:
+        # Attende lo stop (o il timeout) nel kernel: nessun risveglio inutile tra un conteggio e l'altro
         while True:
-            time.sleep(0.1)
-            if external_stop_event and external_stop_event.is_set():
-                break
-            if time.time() - last_check > count_interval:
-                log_counts(source_dir, dest_dir, logger)
-                last_check = time.time()
+            if external_stop_event is not None:
+                if external_stop_event.wait(timeout=count_interval):
+                    break
+            else:
+                time.sleep(count_interval)
+            log_counts(event_handler, logger)
     finally:
-        observer.stop()
-        observer.join()
+        _unschedule_watch(event_handler, watch)
+        # Attende il completamento delle copie ancora in corso
+        event_handler.shutdown()
         logger.info("Backup worker terminato")
\ No newline at end of file
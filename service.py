@@ -3,7 +3,7 @@ Modulo: backup_service.py
 
 Definisce il servizio Windows (ServiceFramework) che gestisce il ciclo di vita del backup:
 - Legge la configurazione da config.ini (cartelle e log).
-- Crea il logger rotativo nella directory scelta.
+- Crea il logger rotativo (scritto in background) nella directory scelta.
 - Avvia, ferma e monitora il worker in un thread separato.
 - Permette install/start/stop del servizio tramite pywin32.
 """
@@ -18,12 +18,162 @@ import configparser
 import os
 import sys
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import atexit
+import functools
+from dataclasses import dataclass
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from backup_worker import start_backup_worker
 
+# Listener attivi, indicizzati per nome del logger, da fermare alla chiusura del servizio
+_log_listeners = {}
+# Prefisso del nome degli handler aggiunti da setup_logger, seguito dal percorso del file di log
+_HANDLER_PREFIX = "backup-rot-"
+
+
+
+@dataclass(frozen=True)
+class BackupConfig:
+    """
+    Configurazione del servizio letta da config.ini, con i percorsi già normalizzati.
+    Immutabile e con __slots__ espliciti (dataclass(slots=True) richiede Python 3.10).
+    """
+    __slots__ = (
+        'source_dir', 'dest_dir', 'log_dir', 'log_file',
+        'log_max_bytes', 'log_backup_count', 'max_workers', 'max_queue', 'max_pending',
+    )
+    source_dir: str
+    dest_dir: str
+    log_dir: str
+    log_file: str
+    log_max_bytes: int
+    log_backup_count: int
+    max_workers: int
+    max_queue: int
+    max_pending: int
+
+
+def _normalize_path(path):
+    """
+    Normalizza un percorso una volta sola (separatori, '..', maiuscole su Windows).
+    """
+    return os.path.normcase(os.path.normpath(path))
+
+
+@functools.lru_cache(maxsize=1)
+def load_config(config_path):
+    """
+    Legge config.ini e restituisce la configurazione del servizio.
+    Il risultato viene memorizzato: letture successive dello stesso file non accedono al disco.
+
+    Args:
+        config_path (str): Percorso del file config.ini.
+
+    Returns:
+        BackupConfig: Configurazione con percorsi normalizzati.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    max_workers = config.getint('worker', 'max_workers', fallback=4)
+    return BackupConfig(
+        source_dir=_normalize_path(config.get('paths', 'source_dir')),
+        dest_dir=_normalize_path(config.get('paths', 'dest_dir')),
+        log_dir=_normalize_path(config.get('paths', 'log_dir')),
+        log_file=config.get('logging', 'log_file'),
+        log_max_bytes=config.getint('logging', 'log_max_bytes'),
+        log_backup_count=config.getint('logging', 'log_backup_count'),
+        max_workers=max_workers,
+        max_queue=config.getint('worker', 'max_queue', fallback=max_workers * 2),
+        max_pending=config.getint('worker', 'max_pending', fallback=1000),
+    )
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler che accumula i record in memoria e li scrive su file in blocco:
+    ogni flush_interval secondi oppure quando il buffer supera buffer_size caratteri.
+    I record di livello ERROR o superiore vengono scritti subito insieme al buffer.
+    """
+    def __init__(self, filename, flush_interval=30.0, buffer_size=64 * 1024, **kwargs):
+        """
+        Args:
+            filename (str): Percorso del file di log.
+            flush_interval (float): Secondi massimi di permanenza di un record nel buffer.
+            buffer_size (int): Dimensione del buffer (in caratteri) oltre la quale si scrive su file.
+            **kwargs: Parametri passati a RotatingFileHandler (maxBytes, backupCount, ...).
+        """
+        super().__init__(filename, **kwargs)
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered_len = 0
+        self._timer = None
+
+    def emit(self, record):
+        """
+        Accoda il record formattato nel buffer, gestendo la rotazione del file.
+        """
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            # La rotazione tiene conto anche di quanto è ancora nel buffer
+            if self.maxBytes > 0:
+                pending = self.stream.tell() + self._buffered_len + len(msg)
+                if pending >= self.maxBytes:
+                    self._write_buffer()
+                    self.doRollover()
+            self._buffer.append(msg)
+            self._buffered_len += len(msg)
+            if record.levelno >= logging.ERROR or self._buffered_len >= self.buffer_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        except Exception:
+            self.handleError(record)
+
+    def _write_buffer(self):
+        """
+        Scrive il contenuto del buffer sullo stream con un'unica write.
+        """
+        if self._buffer and self.stream is not None:
+            self.stream.write(''.join(self._buffer))
+        self._buffer = []
+        self._buffered_len = 0
+
+    def flush(self):
+        """
+        Scrive su file i record in buffer e annulla il flush temporizzato in attesa.
+        """
+        self.acquire()
+        try:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._write_buffer()
+            super().flush()
+        finally:
+            self.release()
+
+    def close(self):
+        """
+        Scrive i record rimasti nel buffer e chiude il file.
+        """
+        self.acquire()
+        try:
+            self.flush()
+            super().close()
+        finally:
+            self.release()
+
 def setup_logger(log_dir, log_file, max_bytes, backup_count):
     """
     Crea e configura un logger rotativo su file nella directory richiesta.
+    I record vengono accodati da un QueueHandler e scritti su file da un QueueListener
+    in un thread dedicato, così chi logga non attende l'I/O su disco.
+    Il file viene scritto a blocchi tramite BufferedRotatingFileHandler.
 
     Args:
         log_dir (str): Cartella dove creare i file di log.
@@ -34,12 +184,17 @@ def setup_logger(log_dir, log_file, max_bytes, backup_count):
     Returns:
         logging.Logger: Oggetto logger configurato.
     """
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    os.makedirs(log_dir, exist_ok=True)
     full_log_path = os.path.join(log_dir, log_file)
     logger = logging.getLogger("BackupService")
     logger.setLevel(logging.INFO)
-    handler = RotatingFileHandler(
+    # Aggiunge l'handler solo una volta per evitare duplicati in caso di restart.
+    # Il nome lega l'handler al file: se il percorso cambia, quello vecchio viene sostituito.
+    handler_name = f"{_HANDLER_PREFIX}{full_log_path}"
+    if any(h.name == handler_name for h in logger.handlers):
+        return logger
+    shutdown_logger(logger)
+    handler = BufferedRotatingFileHandler(
         full_log_path,
         maxBytes=max_bytes,
         backupCount=backup_count
@@ -49,11 +204,47 @@ def setup_logger(log_dir, log_file, max_bytes, backup_count):
         '%Y-%m-%d %H:%M:%S'
     )
     handler.setFormatter(formatter)
-    # Aggiunge l'handler solo una volta per evitare duplicati in caso di restart
-    if not logger.handlers:
-        logger.addHandler(handler)
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, handler)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.name = handler_name
+    logger.addHandler(queue_handler)
+    listener.start()
+    _log_listeners[logger.name] = listener
+    # Garantisce che coda e buffer vengano scritti anche in caso di uscita inattesa
+    atexit.register(shutdown_logger, logger)
     return logger
 
+def flush_logger(logger):
+    """
+    Scrive su file i record già elaborati dal listener ma ancora nel buffer.
+
+    Args:
+        logger (logging.Logger): Logger creato con setup_logger.
+    """
+    listener = _log_listeners.get(logger.name)
+    if listener is not None:
+        for handler in listener.handlers:
+            handler.flush()
+
+def shutdown_logger(logger):
+    """
+    Ferma il thread di scrittura del logger, scrive su file i record ancora in coda
+    e rimuove gli handler creati da setup_logger, così una nuova chiamata riparte da zero.
+
+    Args:
+        logger (logging.Logger): Logger creato con setup_logger.
+    """
+    listener = _log_listeners.pop(logger.name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    for handler in list(logger.handlers):
+        if handler.name and handler.name.startswith(_HANDLER_PREFIX):
+            logger.removeHandler(handler)
+            handler.close()
+
 class BackupService(win32serviceutil.ServiceFramework):
     """
     Servizio Windows per il backup automatico dei file XML.
@@ -77,7 +268,6 @@ class BackupService(win32serviceutil.ServiceFramework):
         """
         win32serviceutil.ServiceFramework.__init__(self, args)
         self.stop_event = threading.Event()
-        config = configparser.ConfigParser()
 
         # Determina la cartella dove si trova config.ini (compatibile con exe e script)
         if getattr(sys, 'frozen', False):
@@ -85,18 +275,14 @@ class BackupService(win32serviceutil.ServiceFramework):
         else:
             base_path = os.path.dirname(__file__)
         config_path = os.path.join(base_path, 'config.ini')
-        config.read(config_path)
 
         # Leggi le cartelle e i parametri log dal file di configurazione
-        self.src = config.get('paths', 'source_dir')
-        self.dst = config.get('paths', 'dest_dir')
-        self.log_dir = config.get('paths', 'log_dir')
-        self.log_file = config.get('logging', 'log_file')
-        self.log_max_bytes = config.getint('logging', 'log_max_bytes')
-        self.log_backup_count = config.getint('logging', 'log_backup_count')
+        self.cfg = load_config(config_path)
 
         # Prepara logger rotativo sulla directory desiderata
-        self.logger = setup_logger(self.log_dir, self.log_file, self.log_max_bytes, self.log_backup_count)
+        self.logger = setup_logger(
+            self.cfg.log_dir, self.cfg.log_file, self.cfg.log_max_bytes, self.cfg.log_backup_count
+        )
         self.worker_thread = None
 
     def SvcStop(self):
@@ -107,6 +293,8 @@ class BackupService(win32serviceutil.ServiceFramework):
         self.logger.info("Richiesta di stop del servizio Windows...")
         self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
         self.stop_event.set()
+        # Porta su disco i log in buffer nel caso il processo venga terminato prima della fine di SvcDoRun
+        flush_logger(self.logger)
 
     def SvcDoRun(self):
         """
@@ -124,15 +312,23 @@ class BackupService(win32serviceutil.ServiceFramework):
         try:
             self.worker_thread = threading.Thread(
                 target=start_backup_worker,
-                args=(self.src, self.dst, self.logger),
-                kwargs={'count_interval': 60, 'external_stop_event': self.stop_event},
+                args=(self.cfg.source_dir, self.cfg.dest_dir, self.logger),
+                kwargs={
+                    'count_interval': 60,
+                    'external_stop_event': self.stop_event,
+                    'max_workers': self.cfg.max_workers,
+                    'max_queue': self.cfg.max_queue,
+                    'max_pending': self.cfg.max_pending,
+                },
                 daemon=True
             )
             self.worker_thread.start()
             self.worker_thread.join()
         except Exception as e:
-            self.logger.error(f"Errore nel servizio: {e}")
+            self.logger.error("Errore nel servizio: %s", e)
         self.logger.info("Servizio Windows terminato.")
+        # Svuota la coda dei log prima che il processo termini
+        shutdown_logger(self.logger)
 
 if __name__ == '__main__':
     # Permette di installare, avviare, fermare, rimuovere il servizio da linea di comando.